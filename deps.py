@@ -0,0 +1,23 @@
+"""Shared clients for the FastAPI apps, created once per process."""
+import requests
+from requests.adapters import HTTPAdapter
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from youtube_transcript_api import YouTubeTranscriptApi
+
+# HTTP/2 multiplexes concurrent OpenAI calls over a few TLS connections instead of one per request
+client = AsyncOpenAI(
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    ),
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+
+# Pooled keep-alive session so transcript fetches reuse TCP+TLS connections to youtube.com
+http_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=64, pool_maxsize=64)
+http_session.mount("https://", _adapter)
+http_session.mount("http://", _adapter)
+
+ytt_api = YouTubeTranscriptApi(http_client=http_session)
@@ -1,11 +1,14 @@
-from fastapi import FastAPI, HTTPException, Request, Form
+from fastapi import FastAPI, HTTPException, Request, Form, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
-from openai import OpenAI
-import subprocess, os, datetime, json
+from jinja2 import FileSystemBytecodeCache, select_autoescape
+from services import is_transcript_cached, get_youtube_transcript, download_audio_and_info, VideoTooLong, transcribe_with_whisper
+from summaries import summarize_text, summarize_text_stream, summarize_batch
+from storage import list_entries, save_transcript, index_existing_transcripts
+import orjson
+import asyncio, os
 import logging
 from logging.handlers import RotatingFileHandler
 
@@ -28,9 +31,13 @@ logger.addHandler(handler)
 logger.info("Starting FastAPI YouTube Transcript service...")
 
 # Initialize
-client = OpenAI()
-app = FastAPI(title="YouTube Transcript API")
+app = FastAPI(title="YouTube Transcript API", default_response_class=ORJSONResponse)
 templates = Jinja2Templates(directory="templates")
+# Templates only change on deploy: skip the per-render stat and cache compiled bytecode
+os.makedirs(".jinja_cache", exist_ok=True)
+templates.env.auto_reload = False
+templates.env.autoescape = select_autoescape(["html", "xml"])
+templates.env.bytecode_cache = FileSystemBytecodeCache(".jinja_cache")
 
 # CORS restriction
 origins = [
@@ -46,169 +53,152 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Ensure folder exists
-os.makedirs("transcripts", exist_ok=True)
+# In-flight /summarize pipelines by video_id
+_inflight: dict[str, asyncio.Task] = {}
 
-class VideoRequest(BaseModel):
-    video_id: str
+DASHBOARD_PAGE_SIZE = 50
 
-def get_youtube_transcript(video_id: str):
-    """Try to get YouTube captions in the video's own language. Returns (text, language_code)."""
-    try:
-        transcripts = YouTubeTranscriptApi.list_transcripts(video_id)
-        preferred = None
-        for tr in transcripts:
-            if not getattr(tr, "is_generated", False):
-                preferred = tr
-                break
-        if preferred is None:
-            preferred = next(iter(transcripts))
-        entries = preferred.fetch()
-        text = " ".join([t['text'] for t in entries])
-        return text, preferred.language_code
-    except (TranscriptsDisabled, NoTranscriptFound):
-        return None, None
-    except Exception as e:
-        print(f"Transcript error: {e}")
-        return None, None
+# /summarize_batch limits: videos per request, and concurrent fetches (yt-dlp + Whisper) per process
+MAX_BATCH_VIDEOS = 50
+_batch_fetch_sem = asyncio.Semaphore(4)
 
-def get_video_info(video_id: str):
-    """Return (duration_in_seconds, language_code|None) using yt-dlp JSON output."""
-    url = f"https://www.youtube.com/watch?v={video_id}"
-    try:
-        result = subprocess.run(
-            [
-                "yt-dlp",
-                "--no-warnings",
-                "--dump-json",
-                "--skip-download",
-                url,
-            ],
-            check=True,
-            capture_output=True,
-            text=True,
-        )
-        # Some videos/playlists may output multiple lines; take the first JSON object
-        first_line = result.stdout.splitlines()[0] if result.stdout else "{}"
-        data = json.loads(first_line)
-        duration = data.get("duration")
-        language_code = data.get("language")
-        return (int(duration) if duration is not None else 0, language_code)
-    except Exception as e:
-        print(f"Duration fetch error: {e}")
-        return (0, None)
-
-def download_audio(video_id: str, output_file="audio.mp3"):
-    """Download audio using yt-dlp."""
-    url = f"https://www.youtube.com/watch?v={video_id}"
-    subprocess.run([
-        "yt-dlp", "-x", "--audio-format", "mp3", "-o", output_file, url
-    ], check=True)
-    return output_file
-
-def transcribe_with_whisper(file_path: str):
-    """Transcribe using OpenAI Whisper."""
-    with open(file_path, "rb") as f:
-        response = client.audio.transcriptions.create(model="whisper-1", file=f)
-    return response.text
-
-def summarize_text(text: str):
-    """Summarize transcript using GPT."""
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are an assistant that summarizes YouTube videos in a structured, clear, and insightful way.
-Always respond in the same language as the provided transcript.
-Your tone should be concise and intelligent, occasionally using emojis as visual markers.
-When the video is argumentative or analytical, extract and format the content like this:
-
-🎯 Main Argument:
-<1–2 sentence core idea>
-
-🔍 Key Takeaways & Themes:
-- Use bold subheadings and emojis for categories
-- Provide brief but complete bullets (each with its own short explanation)
-- Add names, events, or facts when relevant
-
-📌 Conclusion:
-<Wrap-up of core takeaway or what this means going forward>
-
-If the video is a tutorial or guide, instead focus on:
-- 🎓 Purpose
-- 🔧 Steps / Instructions
-- ✅ Final Outcome
-
-Avoid unnecessary fluff. Focus on clarity and high-level insight.""",
-            },
-            {
-            "role": "user",
-            "content": f"This is the transcript of a YouTube video. Please give a short, clear explanation of what the video is about:\n\n{text}"
-        }]
-    )
-    return response.choices[0].message.content.strip()
+class VideoRequest(BaseModel):
+    video_id: str
+    # Stream the summary back as server-sent events instead of a single JSON reply
+    stream: bool = False
 
-def save_transcript(video_id: str, text: str, summary: str, source: str):
-    """Save transcript locally."""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    path = f"transcripts/{video_id}_{timestamp}.txt"
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(f"[Source: {source}]\n\n")
-        f.write(f"Summary:\n{summary}\n\n---\n\n{text}")
-    return path
+class BatchRequest(BaseModel):
+    video_ids: list[str]
 
-@app.post("/summarize")
-async def summarize_video(req: VideoRequest):
-    video_id = req.video_id.strip()
-    if not video_id:
-        raise HTTPException(status_code=400, detail="Missing video_id")
+app.on_event("startup")(index_existing_transcripts)
 
-    text, detected_language = get_youtube_transcript(video_id)
+async def _fetch_text(video_id: str):
+    """Return (text, source) from YouTube captions, falling back to Whisper transcription."""
+    text, detected_language = await asyncio.to_thread(get_youtube_transcript, video_id)
     source = "youtube"
 
     if not text:
         try:
             # Enforce 10-minute max for free tier when falling back to audio transcription
-            duration_sec, lang_code = get_video_info(video_id)
-            if duration_sec and duration_sec > 600:
-                msg = (
-                    "La versión gratuita solo admite audios de menos de 10 minutos."
-                    if (lang_code or "").startswith("es") else
-                    "Free version only supports less than 10min audios."
-                )
-                raise HTTPException(status_code=400, detail=msg)
-            audio_path = download_audio(video_id)
-            text = transcribe_with_whisper(audio_path)
-            os.remove(audio_path)
+            audio, duration_sec, lang_code = await download_audio_and_info(video_id)
+            text = await transcribe_with_whisper(audio, duration_sec)
             source = "whisper"
             detected_language = lang_code
-        except HTTPException as http_err:
-            # Propagate intended HTTP errors (e.g., 400 for duration limit)
-            raise http_err
+        except VideoTooLong:
+            # yt-dlp rejects the video before printing any metadata, so its language is unknown here
+            raise HTTPException(status_code=400, detail="Free version only supports less than 10min audios.")
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+    return text, source
 
-    summary = summarize_text(text)
-    file_path = save_transcript(video_id, text, summary, source)
+async def _summarize_pipeline(video_id: str):
+    """Fetch or transcribe a video, then summarize and save it."""
+    text, source = await _fetch_text(video_id)
+    summary = await summarize_text(text)
+    file_path = await save_transcript(video_id, text, summary, source)
     return {"video_id": video_id, "source": source, "summary": summary, "file": file_path}
 
+def _sse(data: dict):
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+async def _stream_summary(video_id: str, text: str, source: str):
+    """Yield summary deltas as SSE events, then save and report the saved file.
+
+    The status code is already sent, so failures are reported as a final error event."""
+    parts = []
+    try:
+        async for delta in summarize_text_stream(text):
+            parts.append(delta)
+            yield _sse({"delta": delta})
+        file_path = await save_transcript(video_id, text, "".join(parts).strip(), source)
+    except Exception as e:
+        logger.error(f"Streaming summary failed for {video_id}: {e}")
+        yield _sse({"video_id": video_id, "error": str(e), "done": True})
+        return
+    yield _sse({"video_id": video_id, "source": source, "file": file_path, "done": True})
+
+@app.post("/summarize")
+async def summarize_video(req: VideoRequest, response: Response):
+    video_id = req.video_id.strip()
+    if not video_id:
+        raise HTTPException(status_code=400, detail="Missing video_id")
+
+    response.headers["X-Cache"] = "HIT" if is_transcript_cached(video_id) else "MISS"
+
+    if req.stream:
+        # Fetch before streaming starts so transcript errors still surface as HTTP errors
+        text, source = await _fetch_text(video_id)
+        return StreamingResponse(
+            _stream_summary(video_id, text, source),
+            media_type="text/event-stream",
+            headers={"X-Cache": response.headers["X-Cache"], "Cache-Control": "no-cache"},
+        )
+
+    # Coalesce concurrent requests for the same video onto a single pipeline run
+    task = _inflight.get(video_id)
+    if task is None:
+        task = asyncio.create_task(_summarize_pipeline(video_id))
+        _inflight[video_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(video_id, None))
+    # shield: a disconnecting client must not cancel the work other requests are awaiting
+    return await asyncio.shield(task)
+
+@app.post("/summarize_batch")
+async def summarize_videos(req: BatchRequest):
+    video_ids = list(dict.fromkeys(v.strip() for v in req.video_ids if v.strip()))
+    if not video_ids:
+        raise HTTPException(status_code=400, detail="Missing video_ids")
+    if len(video_ids) > MAX_BATCH_VIDEOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_VIDEOS} video_ids per request")
+
+    async def fetch(video_id: str):
+        async with _batch_fetch_sem:
+            return await _fetch_text(video_id)
+
+    fetched = await asyncio.gather(*[fetch(v) for v in video_ids], return_exceptions=True)
+    results = {}
+    ready = []
+    for video_id, res in zip(video_ids, fetched):
+        if isinstance(res, HTTPException):
+            results[video_id] = {"video_id": video_id, "error": res.detail}
+        elif isinstance(res, Exception):
+            results[video_id] = {"video_id": video_id, "error": str(res)}
+        else:
+            text, source = res
+            ready.append((video_id, text, source))
+
+    summaries = await summarize_batch([text for _, text, _ in ready])
+    for (video_id, text, source), summary in zip(ready, summaries):
+        if isinstance(summary, Exception):
+            results[video_id] = {"video_id": video_id, "error": str(summary)}
+            continue
+        try:
+            file_path = await save_transcript(video_id, text, summary, source)
+        except Exception as e:
+            results[video_id] = {"video_id": video_id, "source": source, "summary": summary, "error": str(e)}
+            continue
+        results[video_id] = {"video_id": video_id, "source": source, "summary": summary, "file": file_path}
+
+    return {"results": [results[v] for v in video_ids]}
+
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request):
-    files = sorted(os.listdir("transcripts"), reverse=True)
-    entries = []
-    for f in files:
-        path = os.path.join("transcripts", f)
-        with open(path, encoding="utf-8") as fp:
-            first_line = fp.readline().strip()
-            summary = ""
-            for line in fp:
-                if line.startswith("Summary:"):
-                    summary = fp.readline().strip()
-                    break
-            entries.append({
-                "filename": f,
-                "source": first_line.replace("[Source:", "").replace("]", "").strip(),
-                "summary": summary
-            })
-    return templates.TemplateResponse("index.html", {"request": request, "entries": entries})
+async def dashboard(request: Request, page: int = 1):
+    page = max(page, 1)
+    # Fetch one extra row to know whether there is a next page. db_lock is a threading.Lock,
+    # so the query runs in a worker thread rather than blocking the event loop on it.
+    rows = await asyncio.to_thread(list_entries, DASHBOARD_PAGE_SIZE + 1, (page - 1) * DASHBOARD_PAGE_SIZE)
+    has_next = len(rows) > DASHBOARD_PAGE_SIZE
+    rows = rows[:DASHBOARD_PAGE_SIZE]
+    entries = [
+        {"filename": os.path.basename(path), "source": source, "summary": summary}
+        for path, source, summary in rows
+    ]
+    return templates.TemplateResponse(
+        "index.html",
+        {"request": request, "entries": entries, "page": page, "has_next": has_next},
+    )
+
+if __name__ == "__main__":
+    import uvicorn
+    # Requires uvloop and httpx[http2]
+    uvicorn.run("main:app", loop="uvloop", workers=4)
@@ -0,0 +1,223 @@
+"""Transcript lookup, audio download and Whisper transcription shared by the FastAPI apps."""
+from youtube_transcript_api import TranscriptsDisabled, NoTranscriptFound
+from deps import client, ytt_api
+from diskcache import Cache
+import orjson
+from operator import attrgetter
+import asyncio, subprocess, io, tempfile
+
+# Persistent transcript cache: repeat hits skip the YouTube fetch + XML parse
+TRANSCRIPT_CACHE_TTL = 7 * 86400
+_tcache = Cache(".cache/transcripts")
+
+# Free tier limit for the Whisper fallback
+MAX_AUDIO_SECONDS = 600
+# Downloads are held in memory: stop reading past this many bytes per allowed second (256 kbps)
+MAX_AUDIO_BYTES_PER_SECOND = 32_000
+
+# Whisper fallback: longer audio is split into overlapping chunks transcribed concurrently
+WHISPER_CHUNK_SECONDS = 60
+WHISPER_CHUNK_OVERLAP = 2
+_whisper_sem = asyncio.Semaphore(5)
+
+_snippet_text = attrgetter("text")
+
+def _transcript_cache_key(video_id: str, languages=None):
+    if languages:
+        return f"video_id:{video_id}:langs={','.join(languages)}"
+    return f"video_id:{video_id}"
+
+def is_transcript_cached(video_id: str, languages=None):
+    return _transcript_cache_key(video_id, languages) in _tcache
+
+def get_youtube_transcript(video_id: str, languages=None):
+    """Try to get YouTube captions. Returns (text, language_code).
+
+    With languages, the first available one is used; otherwise the video's own language,
+    preferring manual captions. Successful lookups are cached on disk; failures are not cached."""
+    key = _transcript_cache_key(video_id, languages)
+    cached = _tcache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        if languages:
+            entries = ytt_api.fetch(video_id, languages=languages)
+            language_code = entries.language_code
+        else:
+            transcripts = ytt_api.list(video_id)
+            preferred = None
+            for tr in transcripts:
+                if not getattr(tr, "is_generated", False):
+                    preferred = tr
+                    break
+            if preferred is None:
+                preferred = next(iter(transcripts))
+            entries = preferred.fetch()
+            language_code = preferred.language_code
+        text = " ".join(map(_snippet_text, entries))
+        result = (text, language_code)
+        _tcache.set(key, result, expire=TRANSCRIPT_CACHE_TTL)
+        return result
+    except (TranscriptsDisabled, NoTranscriptFound):
+        return None, None
+    except Exception as e:
+        print(f"Transcript error: {e}")
+        return None, None
+
+class _OutputTooLarge(Exception):
+    pass
+
+async def _run_yt_dlp(*args: str, max_stdout: int | None = None):
+    """Run yt-dlp without blocking the event loop. Returns (stdout, stderr) as bytes.
+
+    With max_stdout, yt-dlp is killed and _OutputTooLarge raised once stdout grows past it."""
+    proc = await asyncio.create_subprocess_exec(
+        "yt-dlp", *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def read_stdout():
+        buf = bytearray()
+        while chunk := await proc.stdout.read(1 << 16):
+            buf += chunk
+            if max_stdout is not None and len(buf) > max_stdout:
+                raise _OutputTooLarge(len(buf))
+        return bytes(buf)
+
+    stderr_task = asyncio.ensure_future(proc.stderr.read())
+    try:
+        stdout = await read_stdout()
+        stderr = await stderr_task
+        await proc.wait()
+    except BaseException:
+        # Don't leave an orphaned yt-dlp behind on cancellation or an oversized download.
+        # wait() only returns once the pipes are closed, so drain what is left in them.
+        if proc.returncode is None:
+            proc.kill()
+        await proc.stdout.read()
+        await asyncio.wait([stderr_task])
+        await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, ["yt-dlp", *args], stdout, stderr)
+    return stdout, stderr
+
+class VideoTooLong(Exception):
+    """The video is longer than the allowed duration (or live) and was not fully downloaded."""
+
+# yt-dlp exits with 101 when a --break-match-filters filter rejects the video
+_YT_DLP_REJECTED = 101
+
+async def download_audio_and_info(video_id: str, max_duration: int | None = MAX_AUDIO_SECONDS):
+    """Download audio into memory and read its metadata in a single yt-dlp run.
+
+    Returns (audio, duration_in_seconds, language_code|None), where audio is a named BytesIO
+    ready for the Whisper API. When max_duration is set, yt-dlp rejects longer videos, live
+    streams and videos without a known duration without downloading them, and the download is
+    aborted once it outgrows the duration's byte budget; both raise VideoTooLong."""
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    # With "-o -" the audio stream goes to stdout and yt-dlp logs (including --print-json) to stderr.
+    # The native audio stream (m4a/webm) is sent as-is: Whisper accepts it and mp3 conversion needs a file.
+    match_filter = ["--break-match-filters", f"duration<={max_duration} & !is_live"] if max_duration else []
+    max_bytes = max_duration * MAX_AUDIO_BYTES_PER_SECOND if max_duration else None
+    try:
+        stdout, stderr = await _run_yt_dlp(
+            "--no-warnings",
+            *match_filter,
+            "-f", "bestaudio",
+            "-o", "-",
+            "--print-json", "--no-simulate",
+            url,
+            max_stdout=max_bytes,
+        )
+    except _OutputTooLarge as e:
+        raise VideoTooLong(video_id) from e
+    except subprocess.CalledProcessError as e:
+        if max_duration and e.returncode == _YT_DLP_REJECTED:
+            raise VideoTooLong(video_id) from e
+        raise
+    info_lines = [l for l in stderr.splitlines() if l.startswith(b"{")]
+    if not stdout or not info_lines:
+        raise RuntimeError(f"yt-dlp returned no audio for {video_id}")
+    data = orjson.loads(info_lines[-1])
+    audio = io.BytesIO(stdout)
+    # The OpenAI SDK infers the file type from the name
+    audio.name = f"audio.{data.get('ext') or 'webm'}"
+    duration = int(data.get("duration") or 0)
+    if duration <= 0:
+        raise RuntimeError(f"yt-dlp reported no duration for {video_id}")
+    return audio, duration, data.get("language")
+
+def _read_chunks(paths):
+    chunks = []
+    for start, path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        # Windows past the real end of the audio come out empty
+        if data:
+            chunk = io.BytesIO(data)
+            chunk.name = f"chunk_{start}.mp3"
+            chunks.append(chunk)
+    return chunks
+
+async def _split_audio(audio, duration: int):
+    """Split audio into overlapping mono mp3 windows with a single ffmpeg pass.
+
+    The input is piped and decoded once; every window is a separate output of the same
+    ffmpeg run. audio may be any bytes-like object. Returns named BytesIO chunks in order."""
+    length = WHISPER_CHUNK_SECONDS + WHISPER_CHUNK_OVERLAP
+    starts = range(0, duration, WHISPER_CHUNK_SECONDS)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [(start, f"{tmp}/chunk_{start:06d}.mp3") for start in starts]
+        args = ["ffmpeg", "-v", "error", "-i", "pipe:0"]
+        for start, path in paths:
+            args += ["-ss", str(start), "-t", str(length), "-vn", "-ac", "1", "-b:a", "64k", path]
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate(audio)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, args[:5], stdout, stderr)
+        return await asyncio.to_thread(_read_chunks, paths)
+
+def _normalize_word(word: str):
+    return word.strip(".,!?;:\"'").lower()
+
+def _join_overlapping(parts):
+    """Join chunk transcripts, dropping words repeated across the chunk overlap."""
+    words = []
+    for part in parts:
+        new = part.split()
+        for n in range(min(len(words), len(new), 12), 0, -1):
+            if [_normalize_word(w) for w in words[-n:]] == [_normalize_word(w) for w in new[:n]]:
+                new = new[n:]
+                break
+        words.extend(new)
+    return " ".join(words)
+
+async def transcribe_with_whisper(audio, duration: int):
+    """Transcribe an in-memory audio file using OpenAI Whisper.
+
+    Audio longer than one chunk is split into overlapping chunks transcribed concurrently."""
+    if duration <= 0:
+        raise ValueError("audio duration must be known to transcribe it")
+    if duration <= WHISPER_CHUNK_SECONDS:
+        response = await client.audio.transcriptions.create(model="whisper-1", file=audio)
+        return response.text
+
+    # Pipe a view of the download instead of a second in-memory copy
+    with audio.getbuffer() as view:
+        chunks = await _split_audio(view, duration)
+
+    async def transcribe_chunk(chunk):
+        async with _whisper_sem:
+            response = await client.audio.transcriptions.create(model="whisper-1", file=chunk)
+        return response.text
+
+    # gather keeps results in chunk order
+    parts = await asyncio.gather(*[transcribe_chunk(chunk) for chunk in chunks])
+    return _join_overlapping(parts)
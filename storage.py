@@ -0,0 +1,105 @@
+"""Saved transcript files and the SQLite index the dashboard renders from."""
+import asyncio, os, datetime, json, sqlite3, mmap, threading, gzip
+import logging
+
+logger = logging.getLogger("yt_transcript_api")
+
+# Ensure folder exists
+os.makedirs("transcripts", exist_ok=True)
+
+# SQLite index of saved transcripts, so the dashboard doesn't rescan the folder on every view
+db = sqlite3.connect("transcripts/index.db", check_same_thread=False)
+# The connection is shared with save_transcript's worker threads
+db_lock = threading.Lock()
+db.execute("CREATE TABLE IF NOT EXISTS entries(path TEXT PRIMARY KEY, ts INTEGER, source TEXT, summary TEXT)")
+
+# Transcripts are stored as gzip text: a JSON header line ({"source", "summary"}) followed by the transcript
+TRANSCRIPT_COMPRESSLEVEL = 3
+
+# Legacy plain-text header: "[Source: ...]\n\nSummary:\n<summary>..." sits at the top of the file
+_SOURCE_TAG = b"[Source:"
+_SUMMARY_TAG = b"Summary:\n"
+
+def index_transcript(path: str, ts: int, source: str, summary: str):
+    """Add or refresh a transcript in the dashboard index."""
+    with db_lock:
+        db.execute(
+            "INSERT OR REPLACE INTO entries(path, ts, source, summary) VALUES (?, ?, ?, ?)",
+            (path, ts, source, summary),
+        )
+        db.commit()
+
+def list_entries(limit: int, offset: int):
+    """Return (path, source, summary) rows, newest first. Blocking: call it through asyncio.to_thread."""
+    with db_lock:
+        return db.execute(
+            "SELECT path, source, summary FROM entries ORDER BY ts DESC, path DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+
+def _save_transcript_sync(video_id: str, text: str, summary: str, source: str):
+    now = datetime.datetime.now()
+    timestamp = now.strftime("%Y%m%d_%H%M%S")
+    path = f"transcripts/{video_id}_{timestamp}.txt.gz"
+    header = json.dumps({"source": source, "summary": summary}, ensure_ascii=False)
+    # Write under a name the backfill ignores, then rename, so a crash never leaves a partial .txt.gz
+    tmp_path = f"{path}.tmp"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=TRANSCRIPT_COMPRESSLEVEL) as f:
+            f.write(f"{header}\n{text}")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Only the first summary line is shown on the dashboard
+    index_transcript(path, int(now.timestamp()), source, summary.split("\n", 1)[0].strip())
+    return path
+
+async def save_transcript(video_id: str, text: str, summary: str, source: str):
+    """Save transcript locally and record it in the index, off the event loop."""
+    return await asyncio.to_thread(_save_transcript_sync, video_id, text, summary, source)
+
+def read_transcript_header(path: str):
+    """Return (source, first summary line) from a saved transcript file, reading only its head."""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as fp:
+            header = json.loads(fp.readline())
+        return header.get("source", ""), header.get("summary", "").split("\n", 1)[0].strip()
+    if os.path.getsize(path) == 0:
+        return "", ""
+    # Search the mapped file with C-level find instead of iterating lines in Python
+    with open(path, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        source = ""
+        if mm[:len(_SOURCE_TAG)] == _SOURCE_TAG:
+            src_end = mm.find(b"]")
+            if src_end != -1:
+                source = mm[len(_SOURCE_TAG):src_end].decode("utf-8", errors="ignore").strip()
+        summary = ""
+        i = mm.find(_SUMMARY_TAG)
+        if i != -1:
+            start = i + len(_SUMMARY_TAG)
+            end = mm.find(b"\n", start)
+            summary = mm[start:end if end != -1 else len(mm)].decode("utf-8", errors="ignore").strip()
+    return source, summary
+
+def index_existing_transcripts():
+    """Backfill the index with transcripts saved before it existed."""
+    with db_lock:
+        known = {row[0] for row in db.execute("SELECT path FROM entries")}
+    rows = []
+    with os.scandir("transcripts") as it:
+        for entry in it:
+            path = f"transcripts/{entry.name}"
+            if not entry.name.endswith((".txt", ".txt.gz")) or path in known:
+                continue
+            try:
+                source, summary = read_transcript_header(entry.path)
+            except Exception as e:
+                # A corrupt or truncated file must not keep the app from starting
+                logger.warning(f"Skipping unreadable transcript {path}: {e!r}")
+                continue
+            rows.append((path, int(entry.stat().st_mtime), source, summary))
+    with db_lock:
+        db.executemany("INSERT OR REPLACE INTO entries(path, ts, source, summary) VALUES (?, ?, ?, ?)", rows)
+        db.commit()
@@ -0,0 +1,345 @@
+"""GPT summaries with exact and semantic caching."""
+from deps import client
+from diskcache import Cache
+import faiss
+import numpy as np
+import asyncio, os, json, hashlib, sqlite3, threading, time
+import logging
+
+logger = logging.getLogger("yt_transcript_api")
+
+# Persistent summary cache: identical transcripts never hit the LLM twice
+SUMMARY_CACHE_TTL = 30 * 86400
+_scache = Cache(".cache/summaries")
+
+# Semantic summary cache: near-duplicate transcripts (re-uploads, caption edits) reuse a summary
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+EMBEDDING_INPUT_CHARS = 8000
+SEMANTIC_CACHE_THRESHOLD = 0.97
+# Nearest neighbours checked per lookup, in case the closest ones have expired
+SEMANTIC_CACHE_CANDIDATES = 5
+SEMANTIC_CACHE_TTL = SUMMARY_CACHE_TTL
+# Entries are rows in one SQLite table shared by all worker processes; each process mirrors the
+# vectors into its own in-memory FAISS index and syncs new rows incrementally before every lookup.
+SEMANTIC_CACHE_PATH = ".cache/semantic/cache.db"
+_semantic_local = threading.local()
+# Guards the in-memory index only; never held during database or file I/O
+_semantic_lock = threading.Lock()
+_semantic_index = None
+_semantic_last_id = 0
+# A semantic hit would otherwise answer in embedding time instead of GPT time, telling an
+# unauthenticated caller that someone else summarized a similar transcript. Hits are held back
+# to roughly the time of a fresh summary so the response time doesn't reveal that.
+SEMANTIC_HIT_MIN_SECONDS = 4.0
+
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_SYSTEM_PROMPT = """You are an assistant that summarizes YouTube videos in a structured, clear, and insightful way.
+Always respond in the same language as the provided transcript.
+Your tone should be concise and intelligent, occasionally using emojis as visual markers.
+When the video is argumentative or analytical, extract and format the content like this:
+
+🎯 Main Argument:
+<1–2 sentence core idea>
+
+🔍 Key Takeaways & Themes:
+- Use bold subheadings and emojis for categories
+- Provide brief but complete bullets (each with its own short explanation)
+- Add names, events, or facts when relevant
+
+📌 Conclusion:
+<Wrap-up of core takeaway or what this means going forward>
+
+If the video is a tutorial or guide, instead focus on:
+- 🎓 Purpose
+- 🔧 Steps / Instructions
+- ✅ Final Outcome
+
+Avoid unnecessary fluff. Focus on clarity and high-level insight."""
+
+SUMMARY_USER_TEMPLATE = "This is the transcript of a YouTube video. Please give a short, clear explanation of what the video is about:\n\n{text}"
+
+# Shared across all summary calls so OpenAI routes them to the same cached system-prompt prefix.
+# Bump the version whenever SUMMARY_SYSTEM_PROMPT changes.
+SUMMARY_PROMPT_CACHE_KEY = "summ-v1"
+
+# Semantic cache entries only match when model, prompt and embedding model are unchanged
+SEMANTIC_CACHE_VERSION = hashlib.sha256(
+    "\x1f".join((SUMMARY_MODEL, SUMMARY_SYSTEM_PROMPT, EMBEDDING_MODEL)).encode("utf-8")
+).hexdigest()[:16]
+
+SUMMARY_BATCH_SIZE = 16
+# Keeps a batch well inside gpt-4o-mini's context window (~4 chars per token)
+SUMMARY_BATCH_MAX_CHARS = 200_000
+# A full batch can outlast the shared 60s timeout. Retrying a timed-out batch would bill it again,
+# and its items already fall back to summarize_text, so batch calls are never retried.
+SUMMARY_BATCH_TIMEOUT = 180.0
+_batch_client = client.with_options(timeout=SUMMARY_BATCH_TIMEOUT, max_retries=0)
+SUMMARY_BATCH_INSTRUCTIONS = """
+
+You will receive a JSON array of transcripts, each as {"id": <int>, "text": <transcript>}.
+Summarize each transcript independently following the rules above.
+Return a JSON object of the form {"summaries": [{"id": <int>, "summary": <string>}, ...]} with one entry per id."""
+
+def _summary_cache_key(text: str):
+    payload = SUMMARY_SYSTEM_PROMPT + "\x1f" + text + "\x1f" + SUMMARY_MODEL
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _log_prompt_cache_usage(response):
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    if usage is not None:
+        logger.info(f"Summary prompt tokens: {usage.prompt_tokens} (cached: {cached})")
+
+async def _embed(texts: list[str]):
+    """Return L2-normalized float32 embeddings, one row per text."""
+    response = await client.embeddings.create(
+        model=EMBEDDING_MODEL, input=[t[:EMBEDDING_INPUT_CHARS] for t in texts]
+    )
+    vectors = np.array([d.embedding for d in response.data], dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def _semantic_db():
+    """Per-thread connection to the shared semantic cache database, created on first use."""
+    conn = getattr(_semantic_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(SEMANTIC_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(SEMANTIC_CACHE_PATH, timeout=30)
+        # WAL lets worker processes read while another one appends
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, version TEXT, created INTEGER, vector BLOB, summary TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_version_id ON entries(version, id)")
+        _semantic_local.conn = conn
+    return conn
+
+def _semantic_sync(conn):
+    """Mirror entries appended by any process since the last sync into this process's FAISS index."""
+    global _semantic_index, _semantic_last_id
+    with _semantic_lock:
+        last_id = _semantic_last_id
+    cutoff = int(time.time()) - SEMANTIC_CACHE_TTL
+    rows = conn.execute(
+        "SELECT id, vector FROM entries WHERE version = ? AND id > ? AND created >= ? ORDER BY id",
+        (SEMANTIC_CACHE_VERSION, last_id, cutoff),
+    ).fetchall()
+    with _semantic_lock:
+        if _semantic_index is None:
+            # Inner product over L2-normalized vectors is cosine similarity; ids are database row ids
+            _semantic_index = faiss.IndexIDMap(faiss.IndexFlatIP(EMBEDDING_DIM))
+        rows = [row for row in rows if row[0] > _semantic_last_id]
+        if rows:
+            ids = np.array([row[0] for row in rows], dtype="int64")
+            vectors = np.frombuffer(b"".join(row[1] for row in rows), dtype="float32").reshape(len(rows), EMBEDDING_DIM)
+            _semantic_index.add_with_ids(vectors, ids)
+            _semantic_last_id = int(ids[-1])
+
+def _semantic_lookup(vector):
+    """Return the summary of the most similar live prior transcript above the threshold, if any.
+
+    Blocking (SQLite + FAISS search): call it through asyncio.to_thread."""
+    conn = _semantic_db()
+    _semantic_sync(conn)
+    with _semantic_lock:
+        if _semantic_index.ntotal == 0:
+            return None
+        scores, ids = _semantic_index.search(vector.reshape(1, -1), SEMANTIC_CACHE_CANDIDATES)
+    cutoff = int(time.time()) - SEMANTIC_CACHE_TTL
+    for score, entry_id in zip(scores[0], ids[0]):
+        if entry_id == -1 or score < SEMANTIC_CACHE_THRESHOLD:
+            break
+        # The vector and its summary come from the same row, so they always belong together
+        row = conn.execute("SELECT summary, created FROM entries WHERE id = ?", (int(entry_id),)).fetchone()
+        if row is not None and row[1] >= cutoff:
+            return row[0]
+        # Expired, or already pruned by another process
+        with _semantic_lock:
+            _semantic_index.remove_ids(np.array([entry_id], dtype="int64"))
+    return None
+
+def _semantic_add(vector, summary: str):
+    """Append a transcript embedding and its summary to the shared cache and prune expired entries.
+
+    Blocking: call it through asyncio.to_thread. Other processes pick the entry up on their next sync."""
+    conn = _semantic_db()
+    now = int(time.time())
+    with conn:
+        conn.execute(
+            "INSERT INTO entries(version, created, vector, summary) VALUES (?, ?, ?, ?)",
+            (SEMANTIC_CACHE_VERSION, now, vector.astype("float32").tobytes(), summary),
+        )
+        conn.execute("DELETE FROM entries WHERE created < ?", (now - SEMANTIC_CACHE_TTL,))
+
+async def _semantic_hit_delay(started: float):
+    """Sleep until SEMANTIC_HIT_MIN_SECONDS have passed since started (a time.monotonic() value)."""
+    remaining = SEMANTIC_HIT_MIN_SECONDS - (time.monotonic() - started)
+    if remaining > 0:
+        await asyncio.sleep(remaining)
+
+async def _semantic_get(text: str):
+    """Return (vector|None, summary|None). Embedding errors just disable the semantic cache for this call.
+
+    Hits are returned no sooner than SEMANTIC_HIT_MIN_SECONDS after the call started."""
+    started = time.monotonic()
+    try:
+        vector = (await _embed([text]))[0]
+    except Exception as e:
+        logger.warning(f"Embedding error: {e}")
+        return None, None
+    similar = await asyncio.to_thread(_semantic_lookup, vector)
+    if similar is not None:
+        await _semantic_hit_delay(started)
+    return vector, similar
+
+async def summarize_text(text: str):
+    """Summarize transcript using GPT.
+
+    Summaries are cached by a hash of prompt, text and model, then by embedding similarity."""
+    key = _summary_cache_key(text)
+    cached = _scache.get(key)
+    if cached is not None:
+        return cached
+    vector, similar = await _semantic_get(text)
+    if similar is not None:
+        _scache.set(key, similar, expire=SUMMARY_CACHE_TTL)
+        return similar
+    response = await client.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": SUMMARY_USER_TEMPLATE.format(text=text)},
+        ],
+        extra_body={"prompt_cache_key": SUMMARY_PROMPT_CACHE_KEY},
+    )
+    _log_prompt_cache_usage(response)
+    summary = response.choices[0].message.content.strip()
+    _scache.set(key, summary, expire=SUMMARY_CACHE_TTL)
+    if vector is not None:
+        await asyncio.to_thread(_semantic_add, vector, summary)
+    return summary
+
+async def summarize_text_stream(text: str):
+    """Like summarize_text, but yields the summary in pieces as GPT generates it."""
+    key = _summary_cache_key(text)
+    cached = _scache.get(key)
+    if cached is None:
+        vector, cached = await _semantic_get(text)
+        if cached is not None:
+            _scache.set(key, cached, expire=SUMMARY_CACHE_TTL)
+    if cached is not None:
+        yield cached
+        return
+    stream = await client.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": SUMMARY_USER_TEMPLATE.format(text=text)},
+        ],
+        extra_body={"prompt_cache_key": SUMMARY_PROMPT_CACHE_KEY},
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts = []
+    async for event in stream:
+        if event.usage is not None:
+            _log_prompt_cache_usage(event)
+        if not event.choices:
+            continue
+        delta = event.choices[0].delta.content or ""
+        if delta:
+            parts.append(delta)
+            yield delta
+    # Only cache summaries that were generated to completion
+    summary = "".join(parts).strip()
+    _scache.set(key, summary, expire=SUMMARY_CACHE_TTL)
+    if vector is not None:
+        await asyncio.to_thread(_semantic_add, vector, summary)
+
+def _batch_groups(texts: list[str], indices: list[int]):
+    """Split indices into groups that fit SUMMARY_BATCH_SIZE and SUMMARY_BATCH_MAX_CHARS."""
+    group, size = [], 0
+    for i in indices:
+        if group and (len(group) >= SUMMARY_BATCH_SIZE or size + len(texts[i]) > SUMMARY_BATCH_MAX_CHARS):
+            yield group
+            group, size = [], 0
+        group.append(i)
+        size += len(texts[i])
+    if group:
+        yield group
+
+async def _summarize_group(texts, keys, group, vectors, summaries):
+    """Summarize one group of transcripts with a single GPT call, filling summaries in place.
+
+    API or parse errors leave the group's entries unset so they fall back to summarize_text."""
+    if len(group) < 2:
+        return
+    try:
+        response = await _batch_client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT + SUMMARY_BATCH_INSTRUCTIONS},
+                {
+                    "role": "user",
+                    "content": json.dumps([{"id": i, "text": texts[i]} for i in group], ensure_ascii=False),
+                },
+            ],
+            response_format={"type": "json_object"},
+            extra_body={"prompt_cache_key": SUMMARY_PROMPT_CACHE_KEY},
+        )
+        _log_prompt_cache_usage(response)
+        items = json.loads(response.choices[0].message.content).get("summaries", [])
+    except Exception as e:
+        logger.warning(f"Batch summary error, falling back to single summaries: {e}")
+        return
+    by_id = {item.get("id"): item.get("summary") for item in items if isinstance(item, dict)}
+    for i in group:
+        summary = by_id.get(i)
+        if isinstance(summary, str) and summary.strip():
+            summaries[i] = summary.strip()
+            _scache.set(keys[i], summaries[i], expire=SUMMARY_CACHE_TTL)
+            if i in vectors:
+                await asyncio.to_thread(_semantic_add, vectors[i], summaries[i])
+
+async def summarize_batch(texts: list[str]) -> list:
+    """Summarize several transcripts in as few GPT calls as fit the batch limits, in input order.
+
+    Cached summaries are reused; anything a batch call fails on or leaves out falls back to
+    summarize_text. Items that still fail are returned as the exception raised."""
+    keys = [_summary_cache_key(t) for t in texts]
+    summaries = [_scache.get(k) for k in keys]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+
+    vectors = {}
+    if len(missing) > 1:
+        started = time.monotonic()
+        try:
+            vectors = dict(zip(missing, await _embed([texts[i] for i in missing])))
+        except Exception as e:
+            logger.warning(f"Embedding error: {e}")
+        hit = False
+        for i, vector in vectors.items():
+            similar = await asyncio.to_thread(_semantic_lookup, vector)
+            if similar is not None:
+                hit = True
+                summaries[i] = similar
+                _scache.set(keys[i], similar, expire=SUMMARY_CACHE_TTL)
+        missing = [i for i in missing if summaries[i] is None]
+        # Remaining misses wait on GPT anyway; only an all-hit batch needs holding back
+        if hit and not missing:
+            await _semantic_hit_delay(started)
+
+    if len(missing) > 1:
+        await asyncio.gather(*[
+            _summarize_group(texts, keys, group, vectors, summaries)
+            for group in _batch_groups(texts, missing)
+        ])
+
+    leftover = [i for i, summary in enumerate(summaries) if summary is None]
+    fallback = await asyncio.gather(*[summarize_text(texts[i]) for i in leftover], return_exceptions=True)
+    for i, summary in zip(leftover, fallback):
+        summaries[i] = summary
+    return summaries
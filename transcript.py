@@ -2,19 +2,26 @@ import openai
 import subprocess
 import os
 
+_client = None
+
+def _c():
+    """Create the OpenAI client on first use and reuse it afterwards."""
+    global _client
+    _client = _client or openai.OpenAI()
+    return _client
+
 def download_audio(url, output="audio.mp3"):
     subprocess.run(["yt-dlp", "-x", "--audio-format", "mp3", "-o", output, url], check=True)
     return output
 
 def transcribe_audio(file_path):
-    client = openai.OpenAI()
     with open(file_path, "rb") as f:
-        transcript = client.audio.transcriptions.create(model="whisper-1", file=f)
+        transcript = _c().audio.transcriptions.create(model="whisper-1", file=f)
     return transcript.text
 
-# Example usage:
-url = "https://www.youtube.com/watch?v=Q6p18jOKv0Y"
-audio_file = download_audio(url)
-text = transcribe_audio(audio_file)
-print(text)
-
+if __name__ == "__main__":
+    # Example usage:
+    url = "https://www.youtube.com/watch?v=Q6p18jOKv0Y"
+    audio_file = download_audio(url)
+    text = transcribe_audio(audio_file)
+    print(text)